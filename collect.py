@@ -1,308 +1,514 @@
 import os
 import pyperclip
-# import pathlib # Path is imported directly
 import fnmatch
+import functools
+import re
+import sys
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, FrozenSet, Iterator, List, NamedTuple, Optional, Set, TextIO, Tuple
 # import subprocess # Not used
-from pathlib import Path
 
-def get_gitignore_patterns(directory):
-    """Parse .gitignore file if exists and return patterns to be ignored."""
-    gitignore_path = os.path.join(directory, '.gitignore')
-    patterns = []
-    
-    if os.path.exists(gitignore_path):
-        try:
-            with open(gitignore_path, 'r', encoding='utf-8', errors='replace') as f:
-                for line in f:
-                    line = line.strip()
-                    # Skip comments and empty lines
-                    if line and not line.startswith('#'):
-                        patterns.append(line)
-        except IOError as e:
-            # Inform about errors reading .gitignore, but don't stop everything.
-            print(f"Warning: Could not read .gitignore file at {gitignore_path}: {e}")
-            # patterns will remain empty, so nothing will be ignored by .gitignore rules from this file.
-    
-    return patterns
+# File contents are read on a thread pool so that I/O waits overlap. This mostly
+# helps on cold caches and network filesystems; with a warm page cache reads
+# barely block and the pool gains little.
+_READ_WORKERS = 16
+# At most this many files are being read or waiting to be written at any time
+_READ_WINDOW = 256
 
-def should_ignore(path_str, patterns, base_directory_str):
-    """Check if a path should be ignored based on gitignore patterns.
-    Uses fnmatch, which is OS-dependent for case-sensitivity. This often aligns with
-    git's core.ignorecase setting (e.g. case-insensitive on Windows by default).
+# Like git, a file is considered binary if its first 8 KB contain a NUL byte
+_BINARY_SNIFF_SIZE = 8192
+# Files larger than this are left out of the output to bound memory use
+_MAX_FILE_SIZE = 10 * 1024 * 1024
+
+# Header written above each file's content in the output
+_SEP_LINE = "=" * 80 + "\n"
+_HEADER_FMT = _SEP_LINE + "File: {}\n" + _SEP_LINE
+
+# fnmatch folds case wherever os.path.normcase does (e.g. Windows); the compiled
+# rules below must do the same to keep matching behaviour unchanged.
+_PATTERN_FLAGS = re.IGNORECASE if os.path.normcase('A') == 'a' else 0
+
+# Compiled .gitignore rules, bucketed by what a pattern is matched against. Each
+# matcher field is the bound fullmatch() of the alternation of every pattern in that
+# bucket (or None if there are none), so a path is tested with a handful of regex
+# matches instead of one fnmatch call per pattern, and with no per-pattern branching.
+# Patterns without wildcards that name a single path component (the common
+# `/node_modules/`, `/dist`, `.venv` kind) go into frozensets instead, which are
+# checked with a hash lookup before any regex runs.
+_Matcher = Optional[Callable[[str], object]]
+
+class IgnoreRules(NamedTuple):
+    literal_anchored: FrozenSet[str]  # `/dist` - first component of the relative path
+    literal_anchored_dir_only: FrozenSet[str]  # `/node_modules/` - as above, directories only
+    literal_basename: FrozenSet[str]  # `.venv` - basename
+    literal_basename_dir_only: FrozenSet[str]  # `target/` - as above, directories only
+    literal_component: FrozenSet[str]  # every literal basename, against parent directory names
+    path: _Matcher               # `/foo`, `foo/bar` - matched against the whole relative path
+    path_dir_only: _Matcher      # `/foo/`, `foo/bar/` - as above, directories only
+    basename: _Matcher           # `*.log` - matched against the basename
+    basename_dir_only: _Matcher  # `build/` - as above, directories only
+    component: _Matcher          # every basename pattern, matched against parent directory names
+    dir_prefixes: Tuple[str, ...]  # literal `foo/` prefixes whose contents are ignored
+
+def _translate_pattern(pattern: str) -> str:
+    """Translate a glob pattern into a regex fragment meant for fullmatch()."""
+    regex = fnmatch.translate(pattern)
+    # fnmatch.translate() anchors the end with \Z; fullmatch() makes it redundant.
+    if regex.endswith('\\Z'):
+        regex = regex[:-2]
+    return regex
+
+def _is_literal(pattern: str) -> bool:
+    """True if `pattern` has no glob wildcards, so it can be compared as a plain string.
+    Only used where matching is case-sensitive; elsewhere fnmatch folds case.
     """
-    if not patterns:
-        return False
-    
-    abs_path = os.path.abspath(path_str)
-    abs_base_directory = os.path.abspath(base_directory_str)
+    return not _PATTERN_FLAGS and not any(c in pattern for c in '*?[')
 
-    if not abs_path.startswith(abs_base_directory):
-        # Path is outside the scope of this .gitignore (e.g. symlink pointing out)
-        # This function assumes patterns are relative to base_directory_str.
-        return False 
+def _compile_alternation(fragments: List[str]) -> _Matcher:
+    """Combine regex fragments into a single compiled pattern and return its
+    fullmatch method (None if there are no fragments).
+    """
+    if not fragments:
+        return None
+    return re.compile('|'.join(f'(?:{fragment})' for fragment in fragments), _PATTERN_FLAGS).fullmatch
 
-    try:
-        relative_path = os.path.relpath(abs_path, abs_base_directory)
-    except ValueError:
-        # Should not happen if abs_path.startswith(abs_base_directory) is true
-        # and paths are on the same drive (Windows).
-        return False 
-
-    # Normalize path separators to '/' for matching, as gitignore patterns use this.
-    # If abs_path is abs_base_directory itself, relative_path will be ".".
-    # We generally check contents *within* base_directory, so relative_path won't be ".".
-    if relative_path == ".": 
-        # The base directory itself is not typically ignored by its own patterns.
-        # If it were, should_ignore would be called with base_dir as path_str.
-        # For simplicity, assume the root of traversal isn't ignored by its own .gitignore.
-        return False
-    else:
-        relative_path = relative_path.replace(os.sep, '/')
-    
-    path_is_dir = os.path.isdir(abs_path)
+def compile_gitignore_patterns(patterns: List[str]) -> Optional[IgnoreRules]:
+    """Bucket raw .gitignore patterns by kind and compile each bucket once.
+    Returns an IgnoreRules tuple, or None if no pattern can ever match.
+    """
+    literal_anchored: Set[str] = set()
+    literal_anchored_dir_only: Set[str] = set()
+    literal_basename: Set[str] = set()
+    literal_basename_dir_only: Set[str] = set()
+    path: List[str] = []
+    path_dir_only: List[str] = []
+    basename: List[str] = []
+    basename_dir_only: List[str] = []
+    dir_prefixes: List[str] = []
 
     for p_raw in patterns:
         pattern = p_raw.strip()
 
         if not pattern or pattern.startswith('#'): # Should be pre-filtered by get_gitignore_patterns
             continue
-        
+
         if pattern.startswith('!'):
             # Negation patterns are skipped for simplicity, maintaining original behavior.
             # A full implementation would track matches and apply negations last.
             continue
-        
+
         is_dir_only_pattern = pattern.endswith('/')
         if is_dir_only_pattern:
             pattern = pattern[:-1] # Remove trailing slash for matching
-        
-        # Patterns starting with / are anchored to the base_directory
+
+        # Patterns starting with / are anchored to the base_directory.
+        # Anything below a matching directory (e.g. `/logs/` -> `logs/today.txt`) is ignored too.
         if pattern.startswith('/'):
-            anchored_p = pattern[1:]
-            # Check if the relative_path itself matches the anchored pattern
-            if fnmatch.fnmatch(relative_path, anchored_p):
-                if is_dir_only_pattern and not path_is_dir: # e.g. `/foo/` should not match file `foo`
-                    continue # This rule doesn't apply; try next pattern
-                return True
-            # Check if relative_path is a child of an anchored directory pattern
-            # e.g., pattern `/logs/`, relative_path `logs/today.txt`
-            if relative_path.startswith(anchored_p + '/'):
-                return True
+            pattern = pattern[1:]
+            if not pattern:
+                continue
+            if '/' not in pattern and _is_literal(pattern):
+                # Covers both the entry itself and everything below it
+                (literal_anchored_dir_only if is_dir_only_pattern else literal_anchored).add(pattern)
+                continue
+            (path_dir_only if is_dir_only_pattern else path).append(_translate_pattern(pattern))
+            dir_prefixes.append(pattern + '/')
         # Patterns containing / (but not starting with /) are relative to .gitignore dir.
         # Git: "foo/bar" matches "foo/bar" at the current .gitignore level. Does not match "a/foo/bar".
-        # fnmatch needs to match the whole relative_path for this.
         elif '/' in pattern:
-            if fnmatch.fnmatch(relative_path, pattern):
-                if is_dir_only_pattern and not path_is_dir and relative_path == pattern: # e.g. `foo/bar/` vs file `foo/bar`
-                    continue
-                return True
-            # Check if relative_path is a child of such a pattern
-            # e.g. pattern `some/dir`, relative_path `some/dir/file.txt`
-            if relative_path.startswith(pattern + '/'):
-                # Similar to anchored case, pattern implies a directory.
-                return True
+            (path_dir_only if is_dir_only_pattern else path).append(_translate_pattern(pattern))
+            dir_prefixes.append(pattern + '/')
         # Simple patterns (no slashes): match basename, or any directory component.
+        elif _is_literal(pattern):
+            (literal_basename_dir_only if is_dir_only_pattern else literal_basename).add(pattern)
         else:
-            # Match basename of the path/file
-            if fnmatch.fnmatch(os.path.basename(abs_path), pattern):
-                if is_dir_only_pattern and not path_is_dir: # e.g. `build/` vs file `build`
-                    continue
-                return True
-            
-            # Match if any directory component of the path matches the pattern
-            # e.g., pattern `build` should ignore `src/build/index.html`
-            if relative_path: # Ensure not empty string (root case, though unlikely here)
-                # Path(relative_path).parent gives the directory part of relative_path
-                # Path(relative_path).parent.parts gives ('src', 'build') for 'src/build/index.html'
-                path_dir_components = Path(relative_path).parent.parts
-                for part in path_dir_components:
-                    if fnmatch.fnmatch(part, pattern):
-                        # If `pattern` came from `patt/` (is_dir_only_pattern=True), this is fine,
-                        # because `part` refers to a directory component.
-                        return True
-    return False
+            (basename_dir_only if is_dir_only_pattern else basename).append(_translate_pattern(pattern))
 
-def get_directory_tree(directory, gitignore_patterns, base_directory_for_ignore):
-    """Generate a tree representation of the directory structure, respecting .gitignore."""
-    # First check if the provided path is actually a directory
-    if not os.path.isdir(directory):
-        return f"Error: {directory} is not a directory"
+    if not (literal_anchored or literal_anchored_dir_only or literal_basename or literal_basename_dir_only
+            or path or path_dir_only or basename or basename_dir_only):
+        return None
+
+    return IgnoreRules(
+        literal_anchored=frozenset(literal_anchored),
+        literal_anchored_dir_only=frozenset(literal_anchored_dir_only),
+        literal_basename=frozenset(literal_basename),
+        literal_basename_dir_only=frozenset(literal_basename_dir_only),
+        # A directory component is a directory, so dir-only patterns apply to
+        # literal_component and component as well.
+        literal_component=frozenset(literal_basename | literal_basename_dir_only),
+        # Once the leading `/` is stripped, anchored and slash-containing patterns
+        # are matched the same way, so they share one alternation.
+        path=_compile_alternation(path),
+        path_dir_only=_compile_alternation(path_dir_only),
+        basename=_compile_alternation(basename),
+        basename_dir_only=_compile_alternation(basename_dir_only),
+        component=_compile_alternation(basename + basename_dir_only),
+        dir_prefixes=tuple(dir_prefixes),
+    )
+
+def get_gitignore_patterns(directory: str) -> Optional[IgnoreRules]:
+    """Parse .gitignore file if exists and return the compiled rules (see
+    compile_gitignore_patterns), or None if nothing is to be ignored.
+    """
+    gitignore_path = os.path.join(directory, '.gitignore')
+    try:
+        stat_result = os.stat(gitignore_path)
+    except OSError: # No .gitignore (or it can't be reached): nothing is ignored
+        return None
     
-    result = []
+    try:
+        return _compiled_gitignore(gitignore_path, stat_result.st_mtime_ns, stat_result.st_size)
+    except IOError as e:
+        # Inform about errors reading .gitignore, but don't stop everything.
+        print(f"Warning: Could not read .gitignore file at {gitignore_path}: {e}")
+        # Nothing will be ignored by .gitignore rules from this file.
+        return None
+
+@functools.lru_cache(maxsize=32)
+def _compiled_gitignore(gitignore_path: str, mtime_ns: int, size: int) -> Optional[IgnoreRules]:
+    """Read and compile a .gitignore file. Cached by the file's path, mtime and size,
+    so repeated runs over an unchanged tree (e.g. from a watcher or an editor) skip
+    the read and the regex compilation, while an edited file gets a fresh entry.
+    Read errors propagate and are not cached.
+    """
+    patterns = []
+    with open(gitignore_path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            # Skip comments and empty lines
+            if line and not line.startswith('#'):
+                patterns.append(line)
     
-    def print_tree(current_dir_path, prefix=""):
-        # Ensure current_dir_path is a directory before proceeding
-        if not os.path.isdir(current_dir_path): # Should not happen if called correctly
-            return
-            
-        # Get items in directory
+    return compile_gitignore_patterns(patterns)
+
+def should_ignore(relative_path: str, is_dir: bool, patterns: Optional[IgnoreRules]) -> bool:
+    """Check if a path should be ignored based on gitignore patterns.
+    `relative_path` is '/'-separated and relative to the directory holding the
+    .gitignore; walkers build it incrementally instead of re-deriving it from
+    absolute paths. `patterns` are the compiled rules returned by get_gitignore_patterns.
+    Matching follows fnmatch semantics, which are OS-dependent for case-sensitivity. This often
+    aligns with git's core.ignorecase setting (e.g. case-insensitive on Windows by default).
+    """
+    if not patterns:
+        return False
+    return _match_rel(relative_path, is_dir, patterns)
+
+def _relative_prefix(path: str, base_directory: str) -> Optional[str]:
+    """Return `path` relative to `base_directory` as a '/'-separated prefix to which
+    entry names can be appended ('' for the base itself, 'src/build/' for a
+    subdirectory), or None if `path` lies outside `base_directory`.
+    """
+    try:
+        relative_path = os.path.relpath(path, base_directory)
+    except ValueError: # Paths on different drives (Windows)
+        return None
+    if relative_path == '.':
+        return ''
+    if relative_path == os.pardir or relative_path.startswith(os.pardir + os.sep):
+        return None
+    return relative_path.replace(os.sep, '/') + '/'
+
+def _match_rel(relative_path: str, path_is_dir: bool, patterns: IgnoreRules) -> bool:
+    """Match a '/'-separated path relative to the .gitignore directory against
+    compiled rules. The single-pass walker tests each path once, so results are
+    not memoized.
+    """
+    # Split once: the parent part feeds the directory-component check below
+    parent_path, _, basename = relative_path.rpartition('/')
+    first_component, below_first, _ = relative_path.partition('/')
+
+    # Literal patterns are plain hash lookups, so they go first. An anchored
+    # literal ignores the entry it names and everything below it.
+    if first_component in patterns.literal_anchored:
+        return True
+    if first_component in patterns.literal_anchored_dir_only and (below_first or path_is_dir):
+        return True
+    if basename in patterns.literal_basename:
+        return True
+    if path_is_dir and basename in patterns.literal_basename_dir_only:
+        return True
+
+    # Then the remaining cheapest tests: a literal prefix test, then the (short) basename, then
+    # the whole relative path. Anything below a directory named by an anchored or
+    # slash-containing pattern is ignored (e.g. `some/dir` -> `some/dir/file.txt`).
+    if patterns.dir_prefixes and relative_path.startswith(patterns.dir_prefixes):
+        return True
+    if patterns.basename and patterns.basename(basename):
+        return True
+    if patterns.path and patterns.path(relative_path):
+        return True
+
+    # Dir-only patterns (e.g. `build/`) never match a file named `build`
+    if path_is_dir:
+        if patterns.basename_dir_only and patterns.basename_dir_only(basename):
+            return True
+        if patterns.path_dir_only and patterns.path_dir_only(relative_path):
+            return True
+
+    # Match if any directory component of the path matches a simple pattern
+    # e.g., pattern `build` should ignore `src/build/index.html`
+    if parent_path and (patterns.literal_component or patterns.component):
+        # 'src/build' splits into ('src', 'build') for 'src/build/index.html'
+        path_dir_components = parent_path.split('/')
+        if not patterns.literal_component.isdisjoint(path_dir_components):
+            return True
+        if patterns.component and any(map(patterns.component, path_dir_components)):
+            return True
+    return False
+
+def _walk(directory: str, gitignore_patterns: Optional[IgnoreRules], root_rel_prefix: str = "",
+          exclude_path: Optional[str] = None) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """Walk `directory` once, respecting .gitignore, and return (tree_lines, files):
+    the lines of the tree drawing below the root, and (path, relative_path) pairs for
+    the files whose content should be included, in tree order. relative_path is
+    '/'-separated and built during the walk, so no os.path.relpath call is needed.
+    Ignored directories are pruned, so nothing below them is listed or matched.
+    `exclude_path` (absolute, e.g. the output file being written) is left out entirely.
+    """
+    tree_lines = []
+    files = []
+    
+    def visit(current_dir_path: str, prefix: str, rel_prefix: str, collect_files: bool) -> None:
+        # Get items in directory, filtering them based on .gitignore rules while the
+        # directory is read. DirEntry caches the file type from the directory read, so
+        # is_dir() costs no extra stat() call. Each entry is matched exactly once, and
+        # ignored entries never reach the sort or, for directories, get entered at all.
+        valid_items_for_tree = []
         try:
-            items_in_dir = sorted(os.listdir(current_dir_path))
+            with os.scandir(current_dir_path) as it:
+                for entry in it:
+                    if entry.path == exclude_path:
+                        continue
+                    is_dir = entry.is_dir()
+                    rel_path = rel_prefix + entry.name
+                    if should_ignore(rel_path, is_dir, gitignore_patterns):
+                        continue
+                    
+                    # If item is hidden (e.g. .myconfig), it's kept at this stage.
+                    # Hidden items are listed in the tree, but not read or recursed into.
+                    valid_items_for_tree.append((entry, is_dir, rel_path))
         except PermissionError:
-            result.append(f"{prefix}(Permission denied)")
+            tree_lines.append(f"{prefix}(Permission denied)")
             return
         except Exception as e: # Catch other potential OS errors
-            result.append(f"{prefix}(Error listing directory: {str(e)})")
+            tree_lines.append(f"{prefix}(Error listing directory: {str(e)})")
             return
-        
-        # Filter items based on .gitignore and other rules before determining tree structure
-        valid_items_for_tree = []
-        for item_name in items_in_dir:
-            item_path = os.path.join(current_dir_path, item_name)
-            
-            # Apply .gitignore rules first
-            if should_ignore(item_path, gitignore_patterns, base_directory_for_ignore):
-                continue
-            
-            # If item is a hidden file (e.g. .myconfig), it's kept at this stage.
-            # Recursion into hidden directories is handled later.
-            valid_items_for_tree.append(item_name)
+        valid_items_for_tree.sort(key=lambda item: item[0].name)
         
         # Process each valid entry
-        for i, item_name in enumerate(valid_items_for_tree):
-            is_last = i == len(valid_items_for_tree) - 1
-            item_path = os.path.join(current_dir_path, item_name) # Reconstruct item_path for this item
+        last_index = len(valid_items_for_tree) - 1
+        for i, (entry, is_dir, rel_path) in enumerate(valid_items_for_tree):
+            is_last = i == last_index
+            item_name = entry.name
             
-            # Choose the appropriate prefix characters
-            if is_last:
-                branch = "└── "
-                new_prefix = prefix + "    "
-            else:
-                branch = "├── "
-                new_prefix = prefix + "│   "
+            # Choose the appropriate prefix characters and add the entry to the tree
+            branch = "└── " if is_last else "├── "
+            tree_lines.append(prefix + branch + item_name)
             
-            # Add the entry to our result
-            result.append(f"{prefix}{branch}{item_name}")
+            if item_name.startswith('.'):
+                continue
             
-            # Recursively process directories
-            if os.path.isdir(item_path):
-                # Original behavior: hidden directories are not traversed for tree display.
-                # This means if `.git` is not in .gitignore (or un-ignored by `!`),
-                # it would be listed if `valid_items_for_tree` includes it,
-                # but `print_tree` won't recurse into it due to `not item_name.startswith('.')`.
-                if not item_name.startswith('.'): 
-                    print_tree(item_path, new_prefix)
+            # Recursively process directories. Symlinked directories are shown in the
+            # tree, but (like os.walk) their files are not included in the contents.
+            if is_dir:
+                new_prefix = prefix + ("    " if is_last else "│   ")
+                visit(entry.path, new_prefix, rel_path + '/',
+                      collect_files and not entry.is_symlink())
+            elif collect_files:
+                # Binary files are skipped later, when read
+                files.append((entry.path, rel_path))
     
-    # Start the recursive process
-    result.append(os.path.basename(os.path.abspath(directory))) # Root directory name
-    print_tree(directory) # Initial call for the root directory itself
+    visit(directory, "", root_rel_prefix, True)
+    return tree_lines, files
+
+def get_directory_tree(directory: str, gitignore_patterns: Optional[IgnoreRules],
+                       base_directory_for_ignore: str) -> str:
+    """Generate a tree representation of the directory structure, respecting .gitignore."""
+    # First check if the provided path is actually a directory
+    if not os.path.isdir(directory):
+        return f"Error: {directory} is not a directory"
     
-    return '\n'.join(result)
+    # .gitignore rules only apply to paths below the directory that holds them
+    root_rel_prefix = _relative_prefix(directory, base_directory_for_ignore)
+    if root_rel_prefix is None:
+        gitignore_patterns, root_rel_prefix = None, ""
+    
+    tree_lines, _ = _walk(directory, gitignore_patterns, root_rel_prefix)
+    root_name = os.path.basename(os.path.abspath(directory))
+    return '\n'.join([root_name] + tree_lines)
+
+def process_directory(directory_path: str, exclude_path: Optional[str] = None) -> str:
+    """Process all files in a directory, respecting .gitignore rules.
+    `exclude_path`, if given, is left out of the tree and the contents (used for
+    the output file, so a previous or half-written output is never included).
+    """
+    # Join once at the end; repeated string concatenation would copy the
+    # whole output for every file added.
+    return ''.join(_generate_output(directory_path, exclude_path))
 
-def process_directory(directory_path):
-    """Process all files in a directory, respecting .gitignore rules."""
+def write_directory(directory_path: str, out: TextIO, exclude_path: Optional[str] = None) -> int:
+    """Like process_directory, but write the output to `out` (a writable text file)
+    as it is produced, so it is never held in memory as a whole. Pass the path of
+    `out` as `exclude_path` when it may lie inside `directory_path`.
+    Returns the number of characters written.
+    """
+    total_size = 0
+    for chunk in _generate_output(directory_path, exclude_path):
+        out.write(chunk)
+        total_size += len(chunk)
+    return total_size
+
+def _generate_output(directory_path: str, exclude_path: Optional[str] = None) -> Iterator[str]:
+    """Yield the output for process_directory and write_directory chunk by chunk."""
     abs_directory_path = os.path.abspath(directory_path) # Standardize to absolute path
     
     # Check if the path is a directory
     if not os.path.isdir(abs_directory_path):
         if os.path.isfile(abs_directory_path):
             # If it's a single file, process just that file
-            output = f"Processing single file: {os.path.basename(abs_directory_path)}\n\n"
+            yield f"Processing single file: {os.path.basename(abs_directory_path)}\n\n"
             
             try:
-                with open(abs_directory_path, 'r', encoding='utf-8', errors='replace') as f:
-                    content = f.read()
-                    
-                output += f"{'=' * 80}\n"
-                output += f"File: {os.path.basename(abs_directory_path)}\n"
-                output += f"{'=' * 80}\n"
-                output += content + "\n"
+                file_content = _read_text(abs_directory_path)
             except Exception as e:
-                output += f"Error reading file: {str(e)}\n"
+                yield f"Error reading file: {str(e)}\n"
+                return
                 
-            return output
+            yield _HEADER_FMT.format(os.path.basename(abs_directory_path))
+            yield file_content
+            yield "\n"
         else:
-            return f"Error: {abs_directory_path} is neither a file nor a directory"
+            yield f"Error: {abs_directory_path} is neither a file nor a directory"
+        return
     
     # Get gitignore patterns from the root of the processing directory
     gitignore_patterns = get_gitignore_patterns(abs_directory_path)
     
-    # Generate directory tree, passing patterns and the base path for ignore checks
-    # The base_directory for ignore rules is the directory_path itself.
-    tree_structure = get_directory_tree(abs_directory_path, gitignore_patterns, abs_directory_path)
+    # Walk the directory once: this yields both the tree and the files to include
+    if exclude_path is not None:
+        exclude_path = os.path.abspath(exclude_path)
+    tree_lines, files = _walk(abs_directory_path, gitignore_patterns, "", exclude_path)
+    tree_structure = '\n'.join([os.path.basename(abs_directory_path)] + tree_lines)
     
-    # Initialize output string with the tree structure
-    output = f"Directory Structure:\n{tree_structure}\n\n"
-    output += "File Contents:\n"
+    yield f"Directory Structure:\n{tree_structure}\n\n"
+    yield "File Contents:\n"
     
-    # Walk through the directory
-    for root, dirs, files in os.walk(abs_directory_path, topdown=True):
-        # Filter directories to prevent descending into ignored ones (dirs[:] modifies os.walk's list)
-        # Also respect original hidden directory rule
-        
-        # Create a copy of dirs to iterate over, as we're modifying dirs itself
-        original_dirs = list(dirs) 
-        dirs[:] = [] # Clear dirs to selectively re-add non-ignored ones
-
-        for d_name in original_dirs:
-            dir_path = os.path.join(root, d_name)
-            if should_ignore(dir_path, gitignore_patterns, abs_directory_path):
-                continue
-            # Original behavior: skip traversing hidden directories for content processing
-            if d_name.startswith('.'):
-                continue
-            dirs.append(d_name) # Add back to dirs if not ignored
-        
-        for file_name in files:
-            file_path = os.path.join(root, file_name)
+    # Read the collected files on a thread pool, consuming results in tree order.
+    # A new read is submitted as each result is taken, so the workers stay busy
+    # while the window bounds how many file contents are held in memory.
+    with ThreadPoolExecutor(max_workers=_READ_WORKERS) as executor:
+        pending: Deque[Tuple[str, "Future[Tuple[Optional[str], Optional[str]]]"]] = deque()
+        next_index = 0
+        while next_index < len(files) or pending:
+            while next_index < len(files) and len(pending) < _READ_WINDOW:
+                file_path, rel_path = files[next_index]
+                pending.append((rel_path, executor.submit(_read_file, file_path)))
+                next_index += 1
             
-            # Check if the file should be ignored by .gitignore rules first
-            if should_ignore(file_path, gitignore_patterns, abs_directory_path):
+            rel_path, future = pending.popleft()
+            content, note = future.result()
+            if content is None and note is None: # Binary, unreadable, empty or whitespace-only
                 continue
             
-            # Original filters: Skip binary files and hidden files
-            if file_name.startswith('.') or is_binary_file(file_path):
-                continue
-                
-            # Read file content
-            try:
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    content = f.read()
-                
-                # Skip empty files
-                if not content.strip():
-                    continue
-                
-                # Get relative path for display
-                rel_path = os.path.relpath(file_path, abs_directory_path)
-                
-                # Add file content to output
-                output += f"\n{'=' * 80}\n"
-                output += f"File: {rel_path}\n"
-                output += f"{'=' * 80}\n"
-                output += content + "\n"
-            except Exception as e: # Catch errors reading individual files
-                rel_path = os.path.relpath(file_path, abs_directory_path) # Try to get rel_path for error msg
-                output += f"\n{'=' * 80}\n"
-                output += f"File: {rel_path}\n"
-                output += f"{'=' * 80}\n"
-                output += f"Error reading file: {str(e)}\n"
+            yield "\n"
+            yield _HEADER_FMT.format(rel_path)
+            if content is not None:
+                # Add file content to output (yielding "\n" separately avoids copying content)
+                yield content
+                yield "\n"
+            elif note is not None:
+                yield note
+
+def _read_file(file_path: str) -> Tuple[Optional[str], Optional[str]]:
+    """Read a text file for inclusion in the output. Runs on the reader thread pool.
+    The file is opened and read once; the binary check runs on the same bytes.
+    Returns (content, note): (None, None) if the file is binary, unreadable, empty or
+    whitespace-only and should be skipped, or (None, note) with a line to print
+    instead of the content if it is too large or fails while being read.
+    """
+    try:
+        fd = os.open(file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    except OSError: # Unreadable files are skipped, as binary ones are
+        return None, None
     
-    return output
+    try:
+        size = os.fstat(fd).st_size
+        if size > _MAX_FILE_SIZE:
+            # Only sniff the start: large binaries are skipped silently, like small ones
+            if _looks_binary(os.read(fd, _BINARY_SNIFF_SIZE)):
+                return None, None
+            return None, f"Skipped: file is larger than {_MAX_FILE_SIZE // (1024 * 1024)} MB\n"
+        
+        data = _read_fd(fd, size)
+    except Exception as e: # Catch errors reading individual files
+        return None, f"Error reading file: {str(e)}\n"
+    finally:
+        os.close(fd)
+    
+    if _looks_binary(data):
+        return None, None
+    content = _decode_text(data)
+    
+    # Skip empty or whitespace-only files (isspace() scans in place,
+    # unlike strip() which copies the whole content)
+    if not content or content.isspace():
+        return None, None
+    return content, None
+
+def _looks_binary(data: bytes) -> bool:
+    """Check if file bytes are binary, using git's heuristic: a NUL byte within the
+    first 8 KB. Text in other encodings (e.g. Latin-1) is not treated as binary; it is
+    decoded with replacement characters.
+    """
+    return data.find(b'\0', 0, _BINARY_SNIFF_SIZE) != -1
+
+def _read_fd(fd: int, size: int) -> bytes:
+    """Read an open file to EOF, given its fstat() size. A regular file comes back
+    from a single os.read() of size + 1 bytes (the extra byte confirms EOF), which
+    bypasses the buffered I/O stack. Files that are larger than reported (e.g.
+    procfs) or return short reads are read in further chunks.
+    """
+    data = os.read(fd, size + 1)
+    if len(data) != size:
+        chunks = [data]
+        while True:
+            chunk = os.read(fd, 64 * 1024)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        data = b''.join(chunks)
+    return data
 
-def is_binary_file(file_path):
-    """Check if a file is binary."""
+def _decode_text(data: bytes) -> str:
+    """Decode file bytes as UTF-8 (undecodable bytes replaced), translating
+    newlines as open() in text mode would.
+    """
+    content = data.decode('utf-8', 'replace')
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return content
+
+def _read_text(file_path: str) -> str:
+    """Read a whole file as text, see _read_fd and _decode_text."""
+    fd = os.open(file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
     try:
-        # Open in binary read mode to avoid encoding issues during check
-        with open(file_path, 'rb') as f:
-            # Read a chunk of the file
-            chunk = f.read(1024)
-            # Check for null bytes, a common indicator of binary files
-            # More sophisticated checks exist, but this is a common heuristic.
-            if b'\0' in chunk:
-                return True
-            # Attempt to decode as UTF-8; if it fails, it's likely binary or non-UTF-8 text.
-            # For this tool's purpose (text processing), non-UTF-8 text might as well be binary.
-            try:
-                chunk.decode('utf-8')
-            except UnicodeDecodeError:
-                return True
-        return False # No null bytes and decodable as UTF-8 (or empty)
-    except IOError: # File might not be readable
-        return True # Treat as binary/inaccessible if error
+        data = _read_fd(fd, os.fstat(fd).st_size)
+    finally:
+        os.close(fd)
+    return _decode_text(data)
 
+def _clipboard_available() -> bool:
+    """Check whether pyperclip has a usable copy mechanism, without copying anything.
+    pyperclip.is_available() only turns True after the clipboard was first used.
+    """
+    try:
+        copy_func, _ = pyperclip.determine_clipboard()
+    except Exception:
+        return False
+    return bool(copy_func) # pyperclip's "no clipboard" stand-in is falsy
 
-def main():
+def main() -> None:
     import argparse
     
     parser = argparse.ArgumentParser(description='Copy directory or file contents to clipboard and save to context.txt, respecting .gitignore')
@@ -311,22 +517,43 @@ def main():
     
     args = parser.parse_args()
     
-    # Process the path (either directory or file)
-    output = process_directory(args.path)
-    
-    # Save to file
-    try:
-        with open(args.output, 'w', encoding='utf-8') as f:
-            f.write(output)
-    except IOError as e:
-        print(f"Error saving output to file {args.output}: {e}")
-        # Optionally, still try to copy to clipboard
+    # Never list or read back the output file itself
+    output_path = os.path.abspath(args.output)
     
-    # Copy to clipboard
-    try:
-        pyperclip.copy(output)
-    except pyperclip.PyperclipException as e:
-        print(f"Error copying to clipboard: {e}")
+    output: Optional[str] = None
+    total_size: Optional[int] = None
+    copied = False
+    if _clipboard_available():
+        # Process the path (either directory or file)
+        output = process_directory(args.path, output_path)
+        total_size = len(output)
+        
+        # Save to file
+        try:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(output)
+        except IOError as e:
+            print(f"Error saving output to file {args.output}: {e}")
+            # Optionally, still try to copy to clipboard
+        
+        # Copy to clipboard
+        try:
+            pyperclip.copy(output)
+            copied = True
+        except pyperclip.PyperclipException as e:
+            print(f"Error copying to clipboard: {e}")
+            print("You might need to install a copy/paste mechanism for your system.")
+            print("For example, on Linux: sudo apt-get install xclip or sudo apt-get install xsel")
+    else:
+        # No clipboard (e.g. headless or over SSH): the output only goes to the file,
+        # so stream it there instead of building it in memory first.
+        try:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                total_size = write_directory(args.path, f, output_path)
+        except IOError as e:
+            print(f"Error saving output to file {args.output}: {e}")
+        
+        print("Clipboard not available, output not copied.")
         print("You might need to install a copy/paste mechanism for your system.")
         print("For example, on Linux: sudo apt-get install xclip or sudo apt-get install xsel")
     
@@ -335,14 +562,41 @@ def main():
         print(f"{processed_path_type} contents processed.")
         if os.path.exists(args.output):
              print(f"Output saved to {args.output}")
-        if 'pyperclip' in globals() and pyperclip.is_available(): # Check if clipboard op likely succeeded
+        if copied:
              print(f"Output copied to clipboard.")
-        print(f"Total size: {len(output)} characters")
+        if total_size is not None:
+            print(f"Total size: {total_size} characters")
     else:
         # Error message would have been printed by process_directory or shown in output string
-        if not output.startswith("Error:"): # if process_directory itself didn't return an error string
+        if output is not None and not output.startswith("Error:"): # if process_directory itself didn't return an error string
             print(f"Path {args.path} not found.")
 
 
+def _compiled_main() -> Optional[Callable[[], None]]:
+    """Return main() from the mypyc build of this module (see setup.py), if it should be used.
+
+    The build is opt-in via COLLECT_COMPILED=1, and an extension older than this
+    file is ignored so a stale build never shadows edits to the source.
+    """
+    if os.environ.get("COLLECT_COMPILED") != "1":
+        return None
+    import importlib
+    import importlib.machinery
+    import importlib.util
+    spec = importlib.util.find_spec("collect")
+    if spec is None or spec.origin is None or not isinstance(spec.loader, importlib.machinery.ExtensionFileLoader):
+        print("COLLECT_COMPILED=1 but no compiled module was found; running from source.", file=sys.stderr)
+        return None
+    if os.path.getmtime(spec.origin) < os.path.getmtime(os.path.abspath(__file__)):
+        print(f"Compiled module {spec.origin} is older than {__file__}; running from source. Rebuild it with setup.py.", file=sys.stderr)
+        return None
+    compiled_main: Callable[[], None] = importlib.import_module("collect").main
+    return compiled_main
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    compiled_main = _compiled_main()
+    if compiled_main is not None:
+        compiled_main()
+    else:
+        main()
@@ -0,0 +1,18 @@
+"""Optional: compile collect.py with mypyc for a faster ignore matcher and walker.
+
+    pip install "mypy>=1.11" setuptools
+    python setup.py build_ext --inplace
+
+This builds a native `collect` extension module next to collect.py. Run the
+script with COLLECT_COMPILED=1 to use it; an extension older than collect.py is
+ignored (with a warning) until it is rebuilt.
+"""
+from setuptools import setup
+from mypyc.build import mypycify
+
+setup(
+    name='collect-project-context',
+    py_modules=['collect'],
+    # pyperclip ships no type information
+    ext_modules=mypycify(['--ignore-missing-imports', 'collect.py']),
+)